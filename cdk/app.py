@@ -17,6 +17,7 @@ PipelineStack(
         env1,
     ],
     source_branch="master",
+    skip_unchanged_stages=True,
     env=env1.get_cdk_env(),
 )
 
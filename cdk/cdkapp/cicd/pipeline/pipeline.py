@@ -5,6 +5,9 @@ import aws_cdk as cdk
 from aws_cdk import (
     aws_codebuild as codebuild,
     aws_codecommit as codecommit,
+    aws_iam as iam,
+    aws_kms as kms,
+    aws_s3 as s3,
     pipelines,
 )
 
@@ -26,6 +29,7 @@ class PipelineStack(cdk.Stack):
         workload_configs: List[EnvironmentConfig],
         source_branch: str,
         pipeline_subtitle: Optional[str] = None,
+        skip_unchanged_stages: bool = False,
         **kwargs,
     ) -> None:
         """
@@ -41,6 +45,12 @@ class PipelineStack(cdk.Stack):
             pipeline_subtitle: the subtitle for the pipeline. The pipeline name will follow the scheme
             "{project_config.NAME}-{pipeline_subtitle}-pipeline" if the argument is set
             "{project_config.NAME}-pipeline" otherwise.
+            skip_unchanged_stages: if set, each stage is deployed by a CodeBuild step that compares the
+            fingerprint of the stage templates and assets with the last successfully deployed one (recorded in
+            the pipeline artifact bucket) and skips the deployment when nothing changed. The manual approval of
+            an unchanged stage is given automatically. The artifact bucket and its key are then created by this
+            stack instead of the pipeline: enabling the option on a deployed pipeline replaces them, and the
+            former ones are retained and must be deleted manually.
             **kwargs: other CDK arguments
 
         """
@@ -54,7 +64,7 @@ class PipelineStack(cdk.Stack):
             repository_name=self.project_config.CODECOMMIT_REPOSITORY_NAME,
         )
 
-        build_image = codebuild.LinuxBuildImage.STANDARD_5_0
+        build_image = codebuild.LinuxBuildImage.STANDARD_7_0
 
         self.build_defaults = pipelines.CodeBuildOptions(
             build_environment=codebuild.BuildEnvironment(
@@ -65,29 +75,53 @@ class PipelineStack(cdk.Stack):
 
         # Get the pipeline name
         if pipeline_subtitle is not None:
-            pipeline_name = f"{project_config.NAME}-{pipeline_subtitle}-pipeline"
+            self.pipeline_name = f"{project_config.NAME}-{pipeline_subtitle}-pipeline"
         else:
-            pipeline_name = f"{project_config.NAME}-pipeline"
+            self.pipeline_name = f"{project_config.NAME}-pipeline"
+
+        self.synth_step = pipelines.ShellStep(
+            "Synth",
+            input=pipelines.CodePipelineSource.code_commit(
+                repository=repo,
+                branch=source_branch,
+            ),
+            install_commands=self.synth_install_commands,
+            commands=["cdk synth --debug"],
+            primary_output_directory="cdk/cdk.out",
+        )
+
+        # The deploy if changed steps record the deployed fingerprints in the artifact bucket,
+        # so it is created here to be known before the pipeline is built
+        self.artifact_bucket = None
+        if skip_unchanged_stages:
+            self.artifact_bucket = s3.Bucket(
+                self,
+                "ArtifactsBucket",
+                encryption_key=kms.Key(
+                    self,
+                    "ArtifactsBucketEncryptionKey",
+                    alias=f"{self.pipeline_name}-artifacts",
+                    enable_key_rotation=True,
+                    removal_policy=cdk.RemovalPolicy.RETAIN,
+                ),
+                encryption=s3.BucketEncryption.KMS,
+                block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+                enforce_ssl=True,
+                removal_policy=cdk.RemovalPolicy.RETAIN,
+            )
 
         # Define the new pipeline
         self.pipeline = pipelines.CodePipeline(
             self,
             "Pipeline",
-            pipeline_name=pipeline_name,
+            pipeline_name=self.pipeline_name,
             cli_version=self.project_config.AWS_CDK_VERSION,
             code_build_defaults=self.build_defaults,
             self_mutation=True,
-            cross_account_keys=True,
-            synth=pipelines.ShellStep(
-                "Synth",
-                input=pipelines.CodePipelineSource.code_commit(
-                    repository=repo,
-                    branch=source_branch,
-                ),
-                install_commands=self.synth_install_commands,
-                commands=["cdk synth --debug"],
-                primary_output_directory="cdk/cdk.out",
-            ),
+            # The key of a given artifact bucket is already a customer managed key usable across accounts
+            cross_account_keys=self.artifact_bucket is None,
+            artifact_bucket=self.artifact_bucket,
+            synth=self.synth_step,
         )
 
         # ######################################################
@@ -98,17 +132,180 @@ class PipelineStack(cdk.Stack):
             # We don't use add_application_stage to be able to give the same name to the stack deployed in each env
             app_stage = cdk.Stage(self, workload_config.SHORT_NAME)
 
-            app_stage = self.pipeline.add_stage(
-                stage=stage_class(
-                    app_stage,
-                    project_config.NAME,
-                    env_config=workload_config,
-                    project_config=project_config,
-                )
+            stage = stage_class(
+                app_stage,
+                project_config.NAME,
+                env_config=workload_config,
+                project_config=project_config,
             )
 
-            if workload_config.MANUAL_APPROVAL:
-                app_stage.add_pre(pipelines.ManualApprovalStep("Approve"))
+            if skip_unchanged_stages:
+                # The stage is still synthesized by the Synth step, but deployed by our own CodeBuild step
+                deploy_step = self.get_deploy_if_changed_step(stage, workload_config)
+                app_stage = self.pipeline.add_wave(workload_config.SHORT_NAME, post=[deploy_step])
+
+                if workload_config.MANUAL_APPROVAL:
+                    approve_step = pipelines.ManualApprovalStep("Approve")
+                    # The wave has no cdk stage ordering its steps, so the deployment waits for the approval
+                    deploy_step.add_step_dependency(approve_step)
+                    # Runs alongside the approval to give it when the stage has nothing to deploy
+                    app_stage.add_pre(
+                        approve_step,
+                        self.get_approve_if_unchanged_step(stage, workload_config.SHORT_NAME),
+                    )
+            else:
+                app_stage = self.pipeline.add_stage(stage=stage)
+
+                if workload_config.MANUAL_APPROVAL:
+                    app_stage.add_pre(pipelines.ManualApprovalStep("Approve"))
+
+    def get_deploy_if_changed_step(self, stage: cdk.Stage, workload_config: EnvironmentConfig):
+        """
+        Get the step deploying the stacks of a stage only if they changed since the last deployment.
+
+        The fingerprint of the stage is the hash of its templates and asset manifests (the asset manifests
+        contain the hashes of the assets). It is compared with the one recorded in the pipeline artifact bucket
+        after the last successful deployment of the stage.
+
+        Args:
+            stage: the stage to deploy
+            workload_config: CDK app config of the stage
+
+        """
+        return pipelines.CodeBuildStep(
+            "DeployIfChanged",
+            input=self.synth_step,
+            install_commands=[
+                f"npm install -g aws-cdk@{self.project_config.AWS_CDK_VERSION}",
+            ],
+            commands=self.fingerprint_commands + self.deploy_if_changed_commands,
+            env={
+                "STAGE_ASSEMBLY": stage.artifact_id,
+                "STAGE_STACKS": f"{stage.node.path}/*",
+                "ARTIFACT_BUCKET": self.artifact_bucket.bucket_name,
+            },
+            role_policy_statements=[
+                *self.get_fingerprint_policy_statements(write=True),
+                # Allow to use the roles created when bootstrapping the workload environment
+                iam.PolicyStatement(
+                    actions=["sts:AssumeRole"],
+                    resources=[f"arn:*:iam::{workload_config.AWS_ACCOUNT_ID}:role/*"],
+                    conditions={
+                        "ForAnyValue:StringEquals": {
+                            "iam:ResourceTag/aws-cdk:bootstrap-role": [
+                                "deploy",
+                                "file-publishing",
+                                "image-publishing",
+                                "lookup",
+                            ],
+                        },
+                    },
+                ),
+            ],
+        )
+
+    def get_approve_if_unchanged_step(self, stage: cdk.Stage, pipeline_stage_name: str):
+        """
+        Get the step giving the manual approval of a stage that did not change since the last deployment.
+
+        Args:
+            stage: the stage to deploy
+            pipeline_stage_name: the name of the codepipeline stage holding the approval
+
+        """
+        pipeline_arn = self.format_arn(service="codepipeline", resource=self.pipeline_name)
+
+        return pipelines.CodeBuildStep(
+            "ApproveIfUnchanged",
+            input=self.synth_step,
+            commands=self.fingerprint_commands + self.approve_if_unchanged_commands,
+            env={
+                "STAGE_ASSEMBLY": stage.artifact_id,
+                "ARTIFACT_BUCKET": self.artifact_bucket.bucket_name,
+                "PIPELINE_NAME": self.pipeline_name,
+                "PIPELINE_STAGE": pipeline_stage_name,
+            },
+            role_policy_statements=[
+                *self.get_fingerprint_policy_statements(write=False),
+                iam.PolicyStatement(
+                    actions=["codepipeline:GetPipelineState"],
+                    resources=[pipeline_arn],
+                ),
+                iam.PolicyStatement(
+                    actions=["codepipeline:PutApprovalResult"],
+                    resources=[f"{pipeline_arn}/{pipeline_stage_name}/Approve"],
+                ),
+            ],
+        )
+
+    def get_fingerprint_policy_statements(self, write: bool):
+        """
+        Get the policy statements needed to read, and optionally record, the deployed fingerprints.
+
+        Args:
+            write: whether the fingerprints can be recorded
+
+        """
+        return [
+            # Listing the prefix tells a missing fingerprint apart from an access error
+            iam.PolicyStatement(
+                actions=["s3:ListBucket"],
+                resources=[self.artifact_bucket.bucket_arn],
+                conditions={"StringLike": {"s3:prefix": "deployed-fingerprints/*"}},
+            ),
+            iam.PolicyStatement(
+                actions=["s3:GetObject", "s3:PutObject"] if write else ["s3:GetObject"],
+                resources=[self.artifact_bucket.arn_for_objects("deployed-fingerprints/*")],
+            ),
+            iam.PolicyStatement(
+                actions=["kms:Decrypt", "kms:Encrypt", "kms:GenerateDataKey*"] if write else ["kms:Decrypt"],
+                resources=[self.artifact_bucket.encryption_key.key_arn],
+            ),
+        ]
+
+    @property
+    def fingerprint_commands(self):
+        """Commands computing the stage fingerprint and getting the deployed one (empty if none was recorded)."""
+        return [
+            'STAGE_DIR=$(find . -type d -name "${STAGE_ASSEMBLY}" | head -n 1)',
+            '[ -n "${STAGE_DIR}" ] || { echo "Assembly ${STAGE_ASSEMBLY} not found."; exit 1; }',
+            "FINGERPRINT=$(cd \"${STAGE_DIR}\" && find . -name '*.template.json' -o -name '*.assets.json' "
+            "| sort | xargs sha256sum | sha256sum | cut -d ' ' -f 1)",
+            'FINGERPRINT_KEY="deployed-fingerprints/${STAGE_ASSEMBLY}.sha256"',
+            # Any error other than a missing fingerprint fails the step
+            'FOUND_KEY=$(aws s3api list-objects-v2 --bucket "${ARTIFACT_BUCKET}" --prefix "${FINGERPRINT_KEY}" '
+            "--query \"Contents[?Key=='${FINGERPRINT_KEY}'].Key | [0]\" --output text)",
+            'DEPLOYED_FINGERPRINT=""',
+            'if [ "${FOUND_KEY}" = "${FINGERPRINT_KEY}" ]; then '
+            'DEPLOYED_FINGERPRINT=$(aws s3 cp "s3://${ARTIFACT_BUCKET}/${FINGERPRINT_KEY}" -); fi',
+        ]
+
+    @property
+    def deploy_if_changed_commands(self):
+        """Commands used by the deploy if changed steps, run after the fingerprint commands."""
+        return [
+            'if [ "${FINGERPRINT}" = "${DEPLOYED_FINGERPRINT}" ]; then '
+            'echo "No change in ${STAGE_ASSEMBLY} since the last deployment, skipping."; '
+            'else cdk deploy --app . --require-approval never "${STAGE_STACKS}" '
+            '&& printf "%s" "${FINGERPRINT}" | aws s3 cp - "s3://${ARTIFACT_BUCKET}/${FINGERPRINT_KEY}"; fi',
+        ]
+
+    @property
+    def approve_if_unchanged_commands(self):
+        """Commands used by the approve if unchanged steps, run after the fingerprint commands."""
+        return [
+            'if [ "${FINGERPRINT}" != "${DEPLOYED_FINGERPRINT}" ]; then '
+            'echo "${STAGE_ASSEMBLY} changed since the last deployment, waiting for the manual approval."; '
+            "else for ATTEMPT in $(seq 1 30); do "
+            'TOKEN=$(aws codepipeline get-pipeline-state --name "${PIPELINE_NAME}" '
+            "--query \"stageStates[?stageName=='${PIPELINE_STAGE}'].actionStates[] | [?actionName=='Approve']"
+            ".latestExecution | [?status=='InProgress'].token | [0]\" --output text) || exit 1; "
+            'if [ "${TOKEN}" != "None" ]; then '
+            'aws codepipeline put-approval-result --pipeline-name "${PIPELINE_NAME}" '
+            '--stage-name "${PIPELINE_STAGE}" --action-name Approve --token "${TOKEN}" '
+            '--result "summary=No change since the last deployment,status=Approved" || exit 1; break; fi; '
+            "sleep 10; done; fi",
+        ]
 
     @property
     def synth_install_commands(self):
@@ -1,10 +1,14 @@
+from typing import Optional
+
 from constructs import Construct
 from aws_cdk import (
+    aws_cloudwatch as cloudwatch,
     aws_ec2 as ec2,
     aws_iam as iam,
     aws_ecs as ecs,
     aws_logs as logs,
     aws_elasticloadbalancingv2 as elasticloadbalancingv2,
+    Duration,
 )
 
 
@@ -23,6 +27,8 @@ class FargateCluster(Construct):
         alb: elasticloadbalancingv2.ApplicationLoadBalancer,
         listner_port: int,
         vpc: ec2.Vpc,
+        discovery_name: Optional[str] = None,
+        request_timeout: Optional[Duration] = None,
     ) -> None:
         """
         Initialise the fargate service custom construct.
@@ -37,11 +43,19 @@ class FargateCluster(Construct):
             container_port: The port on the container
             alb: The load balancer to use
             listner_port: the port to open on the alb
-            vpc: vpc.
+            vpc: vpc
+            discovery_name: if set, the service is registered with service connect under this name in the default
+            namespace of the cluster, and other services of the namespace can call it on http://{discovery_name}
+            request_timeout: the per request timeout applied by the service connect proxy, 15 seconds by default.
 
         """
         super().__init__(scope, id)
 
+        self.cluster = cluster
+        self.service_name = service_name
+        self.container_port = container_port
+        self.discovery_name = discovery_name
+
         task_definition = ecs.FargateTaskDefinition(
             self,
             "TaskDefinition",
@@ -60,9 +74,35 @@ class FargateCluster(Construct):
                 stream_prefix=service_name,
                 log_retention=logs.RetentionDays.ONE_MONTH,
             ),
-            port_mappings=[ecs.PortMapping(container_port=80)],
+            port_mappings=[
+                ecs.PortMapping(
+                    container_port=container_port,
+                    name="http",
+                    app_protocol=ecs.AppProtocol.http,
+                )
+            ],
         )
 
+        # Service connect adds a proxy to the tasks that load balances, retries and times out the calls
+        # made to the other services of the namespace over the private subnets
+        service_connect_configuration = None
+        if discovery_name is not None:
+            service_connect_configuration = ecs.ServiceConnectProps(
+                services=[
+                    ecs.ServiceConnectService(
+                        port_mapping_name="http",
+                        discovery_name=discovery_name,
+                        dns_name=discovery_name,
+                        port=container_port,
+                        per_request_timeout=request_timeout or Duration.seconds(15),
+                    )
+                ],
+                log_driver=ecs.LogDrivers.aws_logs(
+                    stream_prefix=f"{service_name}-service-connect",
+                    log_retention=logs.RetentionDays.ONE_MONTH,
+                ),
+            )
+
         self.service = ecs.FargateService(
             self,
             "Service",
@@ -71,6 +111,7 @@ class FargateCluster(Construct):
             task_definition=task_definition,
             service_name=service_name,
             desired_count=3,
+            service_connect_configuration=service_connect_configuration,
         )
 
         self.service.connections.allow_from(alb, ec2.Port.tcp(container_port))
@@ -96,3 +137,52 @@ class FargateCluster(Construct):
             port=listner_port,
             protocol=elasticloadbalancingv2.ApplicationProtocol.HTTP,
         )
+
+    def allow_service_connect_from(self, other: "FargateCluster"):
+        """Allow another service to call this service directly through service connect."""
+        self.service.connections.allow_from(other.service, ec2.Port.tcp(self.container_port))
+
+    def metric_service_connect(self, metric_name: str, statistic: str = "Sum", period: Optional[Duration] = None):
+        """
+        Get a service connect metric of the calls received by this service.
+
+        Args:
+            metric_name: the service connect metric name (RequestCount, TargetResponseTime, ...)
+            statistic: the statistic to apply
+            period: the period over which the statistic is applied, 5 minutes by default.
+
+        """
+        if self.discovery_name is None:
+            raise ValueError(f"{self.service_name} is not registered with service connect, set discovery_name.")
+
+        return cloudwatch.Metric(
+            namespace="AWS/ECS",
+            metric_name=metric_name,
+            dimensions_map={
+                "ClusterName": self.cluster.cluster_name,
+                "ServiceName": self.service_name,
+                "DiscoveryName": self.discovery_name,
+            },
+            statistic=statistic,
+            period=period or Duration.minutes(5),
+        )
+
+    def metric_request_count(self):
+        """Get the number of requests received by this service through service connect."""
+        return self.metric_service_connect("RequestCount")
+
+    def metric_target_response_time(self):
+        """Get the average response time of this service through service connect."""
+        return self.metric_service_connect("TargetResponseTime", statistic="Average")
+
+    def metric_target_5xx_count(self):
+        """Get the number of 5XX errors returned by this service through service connect."""
+        return self.metric_service_connect("HTTPCode_Target_5XX_Count")
+
+    def metric_active_connection_count(self):
+        """Get the average number of connections opened to this service through service connect."""
+        return self.metric_service_connect("ActiveConnectionCount", statistic="Average")
+
+    def metric_new_connection_count(self):
+        """Get the number of new connections opened to this service through service connect."""
+        return self.metric_service_connect("NewConnectionCount")
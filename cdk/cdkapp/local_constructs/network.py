@@ -30,7 +30,7 @@ class Network(Construct):
         self.vpc = ec2.Vpc(
             self,
             "vpc",
-            cidr=vpc_cidr,
+            ip_addresses=ec2.IpAddresses.cidr(vpc_cidr),
             enable_dns_hostnames=True,
             enable_dns_support=True,
             max_azs=3,
@@ -43,7 +43,7 @@ class Network(Construct):
                 ),
                 ec2.SubnetConfiguration(
                     name="Private",
-                    subnet_type=ec2.SubnetType.PRIVATE_WITH_NAT,
+                    subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS,
                     cidr_mask=subnets_mask,
                 ),
                 ec2.SubnetConfiguration(
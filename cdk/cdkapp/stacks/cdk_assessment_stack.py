@@ -114,7 +114,10 @@ class CdkAssessmentStack(Stack):
             self,
             "ASG",
             instance_type=ec2.InstanceType(instance_type_identifier=environment_config.EC2_INSTANCE_TYPE),
-            machine_image=ec2.MachineImage.latest_amazon_linux(),
+            machine_image=ec2.MachineImage.from_ssm_parameter(
+                "/aws/service/ami-amazon-linux-latest/amzn-ami-hvm-x86_64-gp2",
+                os=ec2.OperatingSystemType.LINUX,
+            ),
             vpc=network.vpc,
             vpc_subnets=ec2.SubnetSelection(subnets=network.vpc.private_subnets),
             role=asg_ec2_role,
@@ -148,7 +151,17 @@ class CdkAssessmentStack(Stack):
         ### Create the fargate apps infrastructure using a custom construct
         ##################
         # Create the cluster that is shared by the services
-        cluster = ecs.Cluster(self, "App", cluster_name=construct_id, vpc=network.vpc)
+        # The services are registered in its private namespace to call each other without going through the alb
+        cluster = ecs.Cluster(
+            self,
+            "App",
+            cluster_name=construct_id,
+            vpc=network.vpc,
+            default_cloud_map_namespace=ecs.CloudMapNamespaceOptions(
+                name=f"{construct_id.lower()}.internal",
+                use_for_service_connect=True,
+            ),
+        )
 
         # Create the first fargate service
         fargate_app1 = FargateCluster(
@@ -162,6 +175,7 @@ class CdkAssessmentStack(Stack):
             alb=alb,
             listner_port=8080,
             vpc=network.vpc,
+            discovery_name="app1",
         )
 
         # Create the second fargate service
@@ -176,8 +190,13 @@ class CdkAssessmentStack(Stack):
             alb=alb,
             listner_port=8081,
             vpc=network.vpc,
+            discovery_name="app2",
         )
 
+        # Allow the services to call each other directly
+        fargate_app1.allow_service_connect_from(fargate_app2)
+        fargate_app2.allow_service_connect_from(fargate_app1)
+
         # Add autoscaling for app2
         app2_auto_scaling_target = fargate_app2.service.auto_scale_task_count(
             min_capacity=3,
@@ -201,6 +220,8 @@ class CdkAssessmentStack(Stack):
         ##################
         ### Create the database cluster
         ##################
+        # instance_props is deprecated, but moving to writer / readers changes the logical ids of the instances
+        # and would replace them
         db_cluster = rds.DatabaseCluster(
             self,
             "darabase",